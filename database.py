@@ -5,11 +5,12 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,34 +23,72 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # One client per process; the pool is shared by all concurrent requests.
+    # zstd needs the zstandard package, zlib is the stdlib fallback.
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=100,
+        minPoolSize=10,
+        waitQueueTimeoutMS=2500,
+        serverSelectionTimeoutMS=2000,
+        compressors="zstd,zlib",
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
     # Convert Pydantic model to dict if needed
     if isinstance(data, BaseModel):
-        data_dict = data.model_dump()
+        data_dict = data.model_dump(mode="json")
     else:
         data_dict = data.copy()
 
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]], ordered: bool = True):
+    """Insert many documents with timestamps in a single round-trip.
+    Pass ordered=False to let the server insert them without stopping at the first error.
+    Returns (inserted_ids, errors); errors holds the index and message of each rejected document."""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump(mode="json") if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    try:
+        result = await db[collection_name].insert_many(docs, ordered=ordered, bypass_document_validation=False)
+    except BulkWriteError as e:
+        # insert_many sets _id on each doc up front; keep the ones the server accepted
+        errors = [{"index": err["index"], "error": err.get("errmsg")} for err in e.details.get("writeErrors", [])]
+        if ordered:
+            inserted = docs[:e.details.get("nInserted", 0)]
+        else:
+            failed = {err["index"] for err in errors}
+            inserted = [d for i, d in enumerate(docs) if i not in failed]
+        return [str(d["_id"]) for d in inserted], errors
+    return [str(i) for i in result.inserted_ids], []
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally returning only the projected fields"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    # large batches keep getMore round-trips down when reading whole collections
+    cursor = db[collection_name].find(filter_dict or {}, projection, batch_size=1000)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
@@ -1,31 +1,85 @@
 import os
+import asyncio
+import logging
+import orjson
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from bson import ObjectId
+from cachetools import TTLCache
 
-from database import db, create_document, get_documents
+from database import db, create_document, create_documents, get_documents
 from schemas import Student, Assessment
 
-app = FastAPI(title="Student Performance API")
+def _orjson_default(value: Any) -> str:
+    # only ObjectId gets special handling; anything else unknown is a bug, not a string
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+class MongoJSONResponse(ORJSONResponse):
+    # orjson writes ObjectId values as strings, so raw Mongo documents need no per-row conversion.
+    # Only routes that return it directly skip jsonable_encoder; dict returns still go through it.
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+
+app = FastAPI(title="Student Performance API", default_response_class=MongoJSONResponse)
+logger = logging.getLogger(__name__)
+
+# Overview is read-mostly; serve it from memory for a few seconds.
+# Per-process only: each worker keeps its own copy.
+overview_cache = TTLCache(maxsize=1, ttl=int(os.getenv("OVERVIEW_CACHE_TTL", 30)))
+# Bumped on every assessment write; an overview computed across a bump is not cached
+overview_version = 0
+# Collection names for /test, so repeated probes don't each hit the database
+collections_cache = TTLCache(maxsize=1, ttl=10)
+
+# FRONTEND_URL: comma-separated allowed origins (defaults to any origin).
+# Set it empty when a reverse proxy handles CORS to skip the middleware entirely.
+cors_origins = [o.strip() for o in os.getenv("FRONTEND_URL", "*").split(",") if o.strip()]
+if cors_origins:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=cors_origins,
+        allow_credentials=False,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+
+@app.on_event("startup")
+async def ensure_indexes():
+    if db is None:
+        return
+    # an unreachable database must not stop the app from starting; /test reports it
+    try:
+        # (student_id, subject) also serves plain student_id lookups via its prefix
+        await db["assessment"].create_index([("student_id", 1), ("subject", 1)])
+    except Exception as e:
+        logger.warning("Skipping index setup, database not reachable: %s", e)
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Student Performance Backend Running"}
 
 
+@app.get("/health")
+async def health():
+    # liveness probe: no database round-trip
+    return {"status": "ok"}
+
+
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -41,7 +95,10 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = collections_cache.get("collections")
+                if collections is None:
+                    collections = await db.list_collection_names()
+                    collections_cache["collections"] = collections
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -61,111 +118,157 @@ class AssessmentCreate(Assessment):
     pass
 
 
-def to_object_id(id_str: str) -> ObjectId:
-    try:
-        return ObjectId(id_str)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid ID format")
-
-
-def compute_stats(assessments: List[Dict[str, Any]]):
-    # compute per-subject average, overall average, best/worst, total assessments
-    subject_scores: Dict[str, List[float]] = {}
-    overall_scores: List[float] = []
-    for a in assessments:
-        score = float(a.get("score", 0))
-        total = float(a.get("total", 0)) or 1
-        pct = (score / total) * 100.0
-        overall_scores.append(pct)
-        subject = a.get("subject", "Unknown")
-        subject_scores.setdefault(subject, []).append(pct)
-    per_subject = {s: sum(v)/len(v) for s, v in subject_scores.items()} if subject_scores else {}
-    overall_avg = sum(overall_scores)/len(overall_scores) if overall_scores else 0.0
-    best_subject = max(per_subject, key=per_subject.get) if per_subject else None
-    worst_subject = min(per_subject, key=per_subject.get) if per_subject else None
+# Fields returned by the list endpoints
+STUDENT_LIST_FIELDS = {"name": 1, "email": 1, "class_name": 1, "roll_no": 1}
+ASSESSMENT_LIST_FIELDS = {"student_id": 1, "subject": 1, "score": 1, "total": 1,
+                          "assessment_date": 1, "assessment_type": 1}
+
+
+# Assessment percentage, derived in each pipeline rather than stored: the DB
+# viewer writes assessments directly, so a stored copy could be missing or stale.
+# A missing score counts as 0%, so every counted row also feeds the averages.
+PCT_EXPR = {"$multiply": [{"$divide": [{"$ifNull": ["$score", 0]},
+                                       {"$cond": [{"$gt": ["$total", 0]}, "$total", 1]}]}, 100]}
+
+# Aggregation pipelines, built once at import. Any $match goes first, then a
+# $project trims documents to the fields the later stages read.
+STATS_PROJECT = {"$project": {"_id": 0, "subject": 1, "pct": PCT_EXPR}}
+STATS_FACET = {"$facet": {
+    "per_subject": [
+        {"$group": {"_id": {"$ifNull": ["$subject", "Unknown"]}, "avg": {"$avg": "$pct"}}},
+        # _id breaks ties so best/worst are stable across identical requests
+        {"$sort": {"avg": -1, "_id": 1}},
+    ],
+    "overall": [
+        {"$group": {"_id": None, "avg": {"$avg": "$pct"}, "count": {"$sum": 1}}},
+    ],
+}}
+OVERVIEW_STATS_PIPELINE = [STATS_PROJECT, STATS_FACET]
+
+TOP_STUDENTS_LIMIT = 5
+OVERVIEW_TOP_PIPELINE = [
+    {"$project": {"_id": 0, "student_id": 1, "pct": PCT_EXPR}},
+    {"$group": {"_id": "$student_id", "avgPct": {"$avg": "$pct"}, "count": {"$sum": 1}}},
+    {"$sort": {"avgPct": -1, "_id": 1}},
+    {"$limit": TOP_STUDENTS_LIMIT},
+    # attach student names in the same round-trip
+    # a malformed student_id just gets no name instead of failing the whole list
+    {"$addFields": {"sid": {"$convert": {"input": "$_id", "to": "objectId", "onError": None, "onNull": None}}}},
+    {"$lookup": {"from": "student", "localField": "sid", "foreignField": "_id", "as": "student"}},
+    {"$project": {"_id": 0, "student_id": "$_id", "avgPct": 1, "count": 1,
+                  "student_name": {"$ifNull": [{"$arrayElemAt": ["$student.name", 0]}, None]}}}
+]
+
+
+def invalidate_overview():
+    global overview_version
+    overview_version += 1
+    overview_cache.clear()
+
+
+async def compute_stats(match: Optional[Dict[str, Any]] = None):
+    # per-subject average, overall average, best/worst and count, all computed by MongoDB
+    pipeline = [{"$match": match}, STATS_PROJECT, STATS_FACET] if match else OVERVIEW_STATS_PIPELINE
+    results = await db["assessment"].aggregate(pipeline).to_list(length=1)
+    result = results[0] if results else {}
+    per_subject = result.get("per_subject", [])
+    overall = result.get("overall") or [{"avg": 0.0, "count": 0}]
+    # first row holding the lowest average, so a full tie gives best == worst
+    worst = next((s for s in per_subject if s["avg"] == per_subject[-1]["avg"]), None)
     return {
-        "overall_average": round(overall_avg, 2),
-        "per_subject_average": {k: round(v, 2) for k, v in per_subject.items()},
-        "best_subject": best_subject,
-        "worst_subject": worst_subject,
-        "assessments_count": len(assessments),
+        "overall_average": round(overall[0]["avg"] or 0.0, 2),
+        "per_subject_average": {s["_id"]: round(s["avg"] or 0.0, 2) for s in per_subject},
+        "best_subject": per_subject[0]["_id"] if per_subject else None,
+        "worst_subject": worst["_id"] if worst else None,
+        "assessments_count": overall[0]["count"],
     }
 
 
 # Routes
 @app.post("/api/students", response_model=dict)
-def create_student(student: StudentCreate):
-    student_id = create_document("student", student)
+async def create_student(student: StudentCreate):
+    student_id = await create_document("student", student)
     return {"id": student_id}
 
 
-@app.get("/api/students", response_model=List[dict])
-def list_students():
-    docs = get_documents("student")
-    # Convert ObjectId to string
-    for d in docs:
-        d["_id"] = str(d.get("_id"))
-    return docs
+@app.get("/api/students")
+async def list_students():
+    docs = await get_documents("student", projection=STUDENT_LIST_FIELDS)
+    return MongoJSONResponse(docs)
 
 
 @app.post("/api/assessments", response_model=dict)
-def create_assessment(assessment: AssessmentCreate):
+async def create_assessment(assessment: AssessmentCreate):
     # validate student exists
-    sid = assessment.student_id
-    try:
-        doc = db["student"].find_one({"_id": to_object_id(sid)})
-    except Exception:
-        doc = None
+    doc = await db["student"].find_one({"_id": assessment.student_id}, {"_id": 1})
     if not doc:
         raise HTTPException(status_code=404, detail="Student not found")
-    a_id = create_document("assessment", assessment)
+    a_id = await create_document("assessment", assessment)
+    invalidate_overview()
     return {"id": a_id}
 
 
+@app.post("/api/assessments/bulk", response_model=dict)
+async def create_assessments_bulk(assessments: List[AssessmentCreate]):
+    if not assessments:
+        return {"ids": [], "errors": []}
+    # validate every referenced student with a single query
+    sids = {a.student_id for a in assessments}
+    cursor = db["student"].find({"_id": {"$in": list(sids)}}, {"_id": 1})
+    found = {d["_id"] async for d in cursor}
+    missing = sids - found
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Student not found: {', '.join(sorted(map(str, missing)))}")
+    try:
+        # unordered: a rejected document doesn't stop the rest; report it per index
+        ids, errors = await create_documents("assessment", assessments, ordered=False)
+    finally:
+        # even a failed batch may have inserted some rows
+        invalidate_overview()
+    return {"ids": ids, "errors": errors}
+
+
 @app.get("/api/students/{student_id}/assessments")
-def get_student_assessments(student_id: str):
-    docs = get_documents("assessment", {"student_id": student_id})
-    for d in docs:
-        d["_id"] = str(d.get("_id"))
-    return docs
+async def get_student_assessments(student_id: str):
+    docs = await get_documents("assessment", {"student_id": student_id}, projection=ASSESSMENT_LIST_FIELDS)
+    return MongoJSONResponse(docs)
 
 
 @app.get("/api/students/{student_id}/stats")
-def get_student_stats(student_id: str):
-    assessments = get_documents("assessment", {"student_id": student_id})
-    stats = compute_stats(assessments)
+async def get_student_stats(student_id: str):
+    stats = await compute_stats({"student_id": student_id})
     return stats
 
 
-@app.get("/api/overview")
-def overall_overview():
-    # overall stats across all students
-    assessments = get_documents("assessment")
-    stats = compute_stats(assessments)
-    # add top students by average
-    pipeline = [
-        {"$addFields": {"pct": {"$multiply": [{"$divide": ["$score", {"$cond": [
-            {"$gt": ["$total", 0]}, "$total", 1]}]}, 100]}}},
-        {"$group": {"_id": "$student_id", "avgPct": {"$avg": "$pct"}, "count": {"$sum": 1}}},
-        {"$sort": {"avgPct": -1}},
-        {"$limit": 5}
-    ]
+async def top_students():
+    # top students by average, with names attached; None if the query failed
     try:
-        top = list(db["assessment"].aggregate(pipeline))
-        for t in top:
-            t["student_id"] = t.pop("_id")
-            # attach student name
-            sdoc = db["student"].find_one({"_id": to_object_id(t["student_id"])})
-            t["student_name"] = sdoc.get("name") if sdoc else None
-    except Exception:
-        top = []
-    stats["top_students"] = top
+        # the result is bounded by $limit, so ask for it in a single batch
+        cursor = db["assessment"].aggregate(OVERVIEW_TOP_PIPELINE, batchSize=TOP_STUDENTS_LIMIT)
+        return await cursor.to_list(length=TOP_STUDENTS_LIMIT)
+    except Exception as e:
+        logger.warning("Top students aggregation failed: %s", e)
+        return None
+
+
+@app.get("/api/overview")
+async def overall_overview():
+    cached = overview_cache.get("overview")
+    if cached is not None:
+        return cached
+    version = overview_version
+    # overall stats across all students; both aggregations run concurrently
+    stats, top = await asyncio.gather(compute_stats(), top_students())
+    stats["top_students"] = top if top is not None else []
+    # skip caching a partial result, or one computed across a write (possibly stale)
+    if top is not None and version == overview_version:
+        overview_cache["overview"] = stats
     return stats
 
 
 # Expose schemas for viewer
 @app.get("/schema")
-def get_schema_info():
+async def get_schema_info():
     # Minimal endpoint to indicate schemas exist; the viewer reads schemas.py directly
     return {"schemas": ["student", "assessment"]}
 
@@ -11,9 +11,27 @@ Model name is converted to lowercase for the collection name:
 - BlogPost -> "blogs" collection
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, PlainSerializer, PlainValidator, WithJsonSchema
+from typing import Annotated, Any, Optional
 from datetime import date
+from bson import ObjectId
+
+
+def _parse_object_id(value: Any) -> ObjectId:
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    raise ValueError("Invalid ID format")
+
+
+# ObjectId parsed once at request validation; dumped back as its hex string
+PyObjectId = Annotated[
+    ObjectId,
+    PlainValidator(_parse_object_id),
+    PlainSerializer(str, return_type=str),
+    WithJsonSchema({"type": "string", "description": "24-character hex ObjectId"}),
+]
 
 # Example schemas (kept for reference; not used by the app but available to the DB viewer)
 class User(BaseModel):
@@ -52,7 +70,7 @@ class Assessment(BaseModel):
     """Assessments collection schema
     Collection name: "assessment"
     """
-    student_id: str = Field(..., description="ID of the student (string ObjectId)")
+    student_id: PyObjectId = Field(..., description="ID of the student (stored as string ObjectId)")
     subject: str = Field(..., description="Subject name e.g., Mathematics")
     score: float = Field(..., ge=0, description="Obtained marks")
     total: float = Field(..., gt=0, description="Total marks")